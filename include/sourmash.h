@@ -116,6 +116,14 @@ void computeparams_set_track_abundance(SourmashComputeParameters *ptr, bool v);
 
 bool computeparams_track_abundance(const SourmashComputeParameters *ptr);
 
+const uint64_t *greedy_min_set_cov(const uint64_t *query_ptr,
+                                   uintptr_t query_size,
+                                   const uint64_t *const *sigs_ptr,
+                                   const uintptr_t *sig_sizes_ptr,
+                                   uintptr_t n_sigs,
+                                   double threshold,
+                                   uintptr_t *size);
+
 uint64_t hash_murmur(const char *kmer, uint64_t seed);
 
 void hll_add_hash(SourmashHyperLogLog *ptr, uint64_t hash);
@@ -239,6 +247,13 @@ double kmerminhash_similarity(const SourmashKmerMinHash *ptr,
                               bool ignore_abundance,
                               bool downsample);
 
+void kmerminhash_similarity_many(const SourmashKmerMinHash *ptr,
+                                 const SourmashKmerMinHash *const *others_ptr,
+                                 uintptr_t insize,
+                                 bool ignore_abundance,
+                                 bool downsample,
+                                 double *output);
+
 void kmerminhash_slice_free(uint64_t *ptr, uintptr_t insize);
 
 bool kmerminhash_track_abundance(const SourmashKmerMinHash *ptr);
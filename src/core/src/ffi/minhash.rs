@@ -406,6 +406,36 @@ unsafe fn kmerminhash_similarity(ptr: *const SourmashKmerMinHash, other: *const
     mh.similarity(other_mh, ignore_abundance, downsample)
 }
 }
+
+ffi_fn! {
+unsafe fn kmerminhash_similarity_many(
+    ptr: *const SourmashKmerMinHash,
+    others_ptr: *const *const SourmashKmerMinHash,
+    insize: usize,
+    ignore_abundance: bool,
+    downsample: bool,
+    output: *mut f64,
+) -> Result<()> {
+    let mh = SourmashKmerMinHash::as_rust(ptr);
+
+    let others = {
+        assert!(!others_ptr.is_null());
+        slice::from_raw_parts(others_ptr, insize)
+    };
+
+    let output = {
+        assert!(!output.is_null());
+        slice::from_raw_parts_mut(output, insize)
+    };
+
+    for (other, similarity) in others.iter().zip(output.iter_mut()) {
+        let other_mh = SourmashKmerMinHash::as_rust(*other);
+        *similarity = mh.similarity(other_mh, ignore_abundance, downsample)?;
+    }
+
+    Ok(())
+}
+}
 ffi_fn! {
 unsafe fn kmerminhash_angular_similarity(ptr: *const SourmashKmerMinHash, other: *const SourmashKmerMinHash)
                                          -> Result<f64> {
@@ -14,8 +14,10 @@ pub mod signature;
 
 use std::ffi::CStr;
 use std::os::raw::c_char;
+use std::slice;
 
 use crate::_hash_murmur;
+use crate::index::search;
 
 #[no_mangle]
 pub unsafe extern "C" fn hash_murmur(kmer: *const c_char, seed: u64) -> u64 {
@@ -27,3 +29,51 @@ pub unsafe extern "C" fn hash_murmur(kmer: *const c_char, seed: u64) -> u64 {
 
     _hash_murmur(c_str.to_bytes(), seed)
 }
+
+ffi_fn! {
+unsafe fn greedy_min_set_cov(
+    query_ptr: *const u64,
+    query_size: usize,
+    sigs_ptr: *const *const u64,
+    sig_sizes_ptr: *const usize,
+    n_sigs: usize,
+    threshold: f64,
+    size: *mut usize,
+) -> Result<*const u64> {
+    let query = {
+        assert!(!query_ptr.is_null());
+        slice::from_raw_parts(query_ptr, query_size)
+    };
+
+    let (sig_ptrs, sig_sizes) = {
+        assert!(!sigs_ptr.is_null());
+        assert!(!sig_sizes_ptr.is_null());
+        (
+            slice::from_raw_parts(sigs_ptr, n_sigs),
+            slice::from_raw_parts(sig_sizes_ptr, n_sigs),
+        )
+    };
+
+    let sigs: Vec<&[u64]> = sig_ptrs
+        .iter()
+        .zip(sig_sizes)
+        .map(|(&ptr, &insize)| {
+            if insize == 0 {
+                &[][..]
+            } else {
+                assert!(!ptr.is_null());
+                slice::from_raw_parts(ptr, insize)
+            }
+        })
+        .collect();
+
+    let output: Vec<u64> = search::greedy_min_set_cov(query, &sigs, threshold)
+        .into_iter()
+        .map(|dataset_id| dataset_id as u64)
+        .collect();
+    *size = output.len();
+
+    // FIXME: make a SourmashSlice_u64 type?
+    Ok(Box::into_raw(output.into_boxed_slice()) as *const u64)
+}
+}
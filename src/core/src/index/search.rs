@@ -1,5 +1,14 @@
+use std::cmp::Reverse;
+use std::collections::{BinaryHeap, HashMap, HashSet};
+use std::hash::BuildHasherDefault;
+
+use nohash_hasher::NoHashHasher;
+
 use crate::index::Comparable;
 
+type HashIntSet = HashSet<u64, BuildHasherDefault<NoHashHasher<u64>>>;
+type HashIntMap<V> = HashMap<u64, V, BuildHasherDefault<NoHashHasher<u64>>>;
+
 pub fn search_minhashes<L>(node: &dyn Comparable<L>, query: &L, threshold: f64) -> bool {
     node.similarity(query) > threshold
 }
@@ -32,3 +41,112 @@ pub fn search_minhashes_find_best<L>() -> fn(&dyn Comparable<L>, &L, f64) -> boo
     */
     unimplemented!();
 }
+
+/// Greedily cover the hashes in `query` with the hash sets in `sigs`.
+///
+/// Returns the index in `sigs` of each pick, in order, until no set has at
+/// least `threshold` hashes in common with the part of the query that is
+/// still uncovered. Ties are broken by position in `sigs`.
+pub fn greedy_min_set_cov(query: &[u64], sigs: &[&[u64]], threshold: f64) -> Vec<usize> {
+    let query: HashIntSet = query.iter().copied().collect();
+
+    // count the hashes each set shares with the query, and build an
+    // inverted index from each query hash to the sets that contain it.
+    let mut counts: Vec<usize> = Vec::with_capacity(sigs.len());
+    let mut common: Vec<Vec<u64>> = Vec::with_capacity(sigs.len());
+    let mut postings: HashIntMap<Vec<usize>> = HashIntMap::default();
+    for (dataset_id, hashes) in sigs.iter().enumerate() {
+        let shared: Vec<u64> = hashes
+            .iter()
+            .copied()
+            .filter(|h| query.contains(h))
+            .collect();
+        for h in &shared {
+            postings.entry(*h).or_default().push(dataset_id);
+        }
+        counts.push(shared.len());
+        common.push(shared);
+    }
+
+    // max-heap on the remaining counts, lowest index first on ties; heap
+    // entries that no longer match `counts` are stale.
+    let mut heap: BinaryHeap<(usize, Reverse<usize>)> = counts
+        .iter()
+        .enumerate()
+        .filter(|(_, &size)| size > 0)
+        .map(|(dataset_id, &size)| (size, Reverse(dataset_id)))
+        .collect();
+
+    let mut picks = vec![];
+    while let Some((size, Reverse(dataset_id))) = heap.pop() {
+        if counts[dataset_id] != size {
+            continue; // stale entry
+        }
+
+        if (size as f64) < threshold {
+            break;
+        }
+
+        picks.push(dataset_id);
+
+        // decrement the counts of every set that contains one of the newly
+        // covered hashes. Covered hashes are dropped from `postings`, so
+        // each query hash is only decremented once over the whole run.
+        let mut touched: HashSet<usize> = HashSet::new();
+        for h in &common[dataset_id] {
+            if let Some(other_ids) = postings.remove(h) {
+                for other_id in other_ids {
+                    counts[other_id] -= 1;
+                    touched.insert(other_id);
+                }
+            }
+        }
+
+        for other_id in touched {
+            if counts[other_id] > 0 {
+                heap.push((counts[other_id], Reverse(other_id)));
+            }
+        }
+    }
+
+    picks
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    #[test]
+    fn greedy_min_set_cov_picks() {
+        let sigs: Vec<&[u64]> = vec![&[1, 2], &[1, 2, 3, 4], &[], &[4, 5, 6], &[7, 8]];
+        let query = [1, 2, 3, 4, 5, 6];
+
+        assert_eq!(greedy_min_set_cov(&query, &sigs, 0.), vec![1, 3]);
+
+        // after the first pick, [4, 5, 6] only has 2 uncovered hashes left.
+        assert_eq!(greedy_min_set_cov(&query, &sigs, 3.), vec![1]);
+
+        assert!(greedy_min_set_cov(&query, &[], 0.).is_empty());
+        assert!(greedy_min_set_cov(&[], &sigs, 0.).is_empty());
+    }
+
+    #[test]
+    fn greedy_min_set_cov_ties() {
+        let sigs: Vec<&[u64]> = vec![&[3, 4], &[1, 2], &[2, 3]];
+
+        assert_eq!(greedy_min_set_cov(&[1, 2, 3, 4], &sigs, 0.), vec![0, 1]);
+    }
+
+    #[test]
+    fn greedy_min_set_cov_shared_non_query_hashes() {
+        // hashes outside of the query don't count, even when shared.
+        let a: Vec<u64> = (0..50).collect();
+        let b: Vec<u64> = (50..60).chain(1000..1300).collect();
+        let c: Vec<u64> = (60..70).chain(1000..1300).collect();
+        let sigs: Vec<&[u64]> = vec![&a, &b, &c];
+        let query: Vec<u64> = (0..200).collect();
+
+        assert_eq!(greedy_min_set_cov(&query, &sigs, 0.), vec![0, 1, 2]);
+        assert_eq!(greedy_min_set_cov(&query, &sigs, 11.), vec![0]);
+    }
+}
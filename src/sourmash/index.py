@@ -2,18 +2,43 @@
 
 import sourmash
 from abc import abstractmethod, ABC
-from collections import namedtuple
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+import heapq
+import io
+import itertools
+import threading
 import zipfile
 import os
 
 
 class Index(ABC):
     is_database = False
+    search_batch_size = 1000
 
     @abstractmethod
     def signatures(self):
         "Return an iterator over all signatures in the Index object."
 
+    def signatures_with_location(self):
+        "Return an iterator over tuples (signature, location) in the Index."
+        # not every Index subclass has a 'location' (e.g. SBT, LCA_Database).
+        location = getattr(self, 'location', None)
+        for ss in self.signatures():
+            yield ss, location
+
+    def __len__(self):
+        """Return the number of signatures in the Index.
+
+        By default this iterates over 'signatures()' once and caches the
+        count; subclasses that support 'insert' must drop '_len_cache' there,
+        or override this with something cheaper.
+        """
+        if not hasattr(self, '_len_cache'):
+            self._len_cache = sum(1 for _ in self.signatures())
+        return self._len_cache
+
     @abstractmethod
     def insert(self, signature):
         """ """
@@ -33,19 +58,24 @@ class Index(ABC):
         search_fn(other_sig, *args) should return a boolean that indicates
         whether other_sig is a match.
 
-        Returns a list.
-        """
+        If 'limit' is given, stop after that many matches are found.
 
-        matches = []
+        Returns a generator; use 'list(idx.find(...))' to get a list.
+        """
+        limit = kwargs.get('limit')
 
+        n_matches = 0
         for node in self.signatures():
             if search_fn(node, *args):
-                matches.append(node)
-        return matches
+                yield node
+
+                n_matches += 1
+                if limit and n_matches >= limit:
+                    break
 
     def search(self, query, threshold=None,
                do_containment=False, do_max_containment=False,
-               ignore_abundance=False, **kwargs):
+               ignore_abundance=False, top_n=None, **kwargs):
         """Return set of matches with similarity above 'threshold'.
 
         Results will be sorted by similarity, highest to lowest.
@@ -57,6 +87,8 @@ class Index(ABC):
             is guaranteed to be best.
           * ignore_abundance: default False. If True, and query signature
             and database support k-mer abundances, ignore those abundances.
+          * top_n: default None. If set, return only the 'top_n' best
+            matches.
 
         Note, the "best only" hint is ignored by LinearIndex.
         """
@@ -69,33 +101,59 @@ class Index(ABC):
         if do_containment and do_max_containment:
             raise TypeError("'do_containment' and 'do_max_containment' cannot both be True")
 
-        # configure search - containment? ignore abundance?
+        # configure search - containment? ignore abundance? pick the bound
+        # method once, rather than dispatching through a lambda for every
+        # signature.
+        qmh = query.minhash
         if do_containment:
-            query_match = lambda x: query.contained_by(x, downsample=True)
+            score_fn = qmh.contained_by
         elif do_max_containment:
-            query_match = lambda x: query.max_containment(x, downsample=True)
+            score_fn = qmh.max_containment
         else:
-            query_match = lambda x: query.similarity(
-                x, downsample=True, ignore_abundance=ignore_abundance)
+            score_fn = None               # similarity is scored in batches
 
         # do the actual search:
-        matches = []
-
-        for ss in self.signatures():
-            score = query_match(ss)
-            if score >= threshold:
-                matches.append((score, ss, self.location))
+        def find_matches():
+            siglocs = iter(self.signatures_with_location())
+            if score_fn is not None:
+                for ss, location in siglocs:
+                    score = score_fn(ss.minhash, downsample=True)
+                    if score >= threshold:
+                        yield (score, ss, location)
+                return
+
+            # score batches of signatures with one call into Rust each.
+            similarity_many = qmh.similarity_many
+            while 1:
+                batch = list(itertools.islice(siglocs, self.search_batch_size))
+                if not batch:
+                    break
+
+                scores = similarity_many([ ss.minhash for ss, _ in batch ],
+                                         downsample=True,
+                                         ignore_abundance=ignore_abundance)
+                for score, (ss, location) in zip(scores.tolist(), batch):
+                    if score >= threshold:
+                        yield (score, ss, location)
+
+        matches = find_matches()
+
+        # only keep the best 'top_n' matches, if requested.
+        if top_n:
+            return heapq.nlargest(top_n, matches, key=lambda x: x[0])
 
         # sort!
+        matches = list(matches)
         matches.sort(key=lambda x: -x[0])
         return matches
 
     def gather(self, query, *args, **kwargs):
         "Return the match with the best Jaccard containment in the Index."
-        if not query.minhash:             # empty query? quit.
+        qmh = query.minhash
+        if not qmh:                       # empty query? quit.
             return []
 
-        scaled = query.minhash.scaled
+        scaled = qmh.scaled
         if not scaled:
             raise ValueError('gather requires scaled signatures')
 
@@ -109,22 +167,88 @@ class Index(ABC):
             n_threshold_hashes = float(threshold_bp) / scaled
 
             # that then requires the following containment:
-            threshold = n_threshold_hashes / len(query.minhash)
+            threshold = n_threshold_hashes / len(qmh)
 
             # is it too high to ever match? if so, exit.
             if threshold > 1.0:
                 return []
 
+        # containment is computed against len(qmh), so signatures with
+        # too few hashes can never meet the threshold. Compare in the same
+        # units as 'contained_by', so that rounding can't drop a signature
+        # that is exactly at the threshold.
+        n_query_hashes = len(qmh)
+
         # actually do search!
         results = []
-        for ss in self.signatures():
-            cont = query.minhash.contained_by(ss.minhash, True)
+        for ss, location in self.signatures_with_location():
+            mh = ss.minhash
+            if len(mh) / n_query_hashes < threshold:
+                continue
+
+            cont = qmh.contained_by(mh, True)
             if cont and cont >= threshold:
-                results.append((cont, ss, self.location))
+                results.append((cont, ss.md5sum(), ss, location))
 
-        results.sort(reverse=True, key=lambda x: (x[0], x[1].md5sum()))
+        # sort on containment, breaking ties with the precomputed md5sum.
+        results.sort(reverse=True, key=itemgetter(0, 1))
 
-        return results
+        return [ (cont, ss, loc) for (cont, _, ss, loc) in results ]
+
+    def counter_gather(self, query, *args, **kwargs):
+        """Return all matches chosen by a greedy min-set-cov of 'query'.
+
+        Each iteration picks the signature with the most hashes in common
+        with the remaining query, and then removes those hashes from the
+        query; this stops when no signature has at least 'threshold_bp'
+        in common with what is left.
+
+        Results are (containment, signature, location) tuples sorted
+        the same way as 'gather'.
+        """
+        qmh = query.minhash
+        if not qmh:                       # empty query? quit.
+            return []
+
+        scaled = qmh.scaled
+        if not scaled:
+            raise ValueError('gather requires scaled signatures')
+
+        query_hashes = qmh._hashes_array()
+
+        threshold_bp = kwargs.get('threshold_bp', 0.0)
+        n_threshold_hashes = float(threshold_bp) / scaled
+
+        # is it too high to ever match? if so, exit.
+        if n_threshold_hashes > len(query_hashes):
+            return []
+
+        # skip signatures that share no hashes with the query, so that we
+        # only pull hashes out of Rust for the candidate matches; those
+        # are copied out only once, directly into numpy arrays.
+        count_common = qmh.count_common
+        signatures = []
+        sig_hashes = []
+        for ss, loc in self.signatures_with_location():
+            mh = ss.minhash
+            if len(mh) < n_threshold_hashes:
+                continue              # too small to ever meet the threshold
+
+            if count_common(mh, True):
+                signatures.append((ss, loc))
+                sig_hashes.append(mh._hashes_array())
+
+        # run the greedy min-set-cov on the raw hashes.
+        results = []
+        for dataset_id in _greedy_min_set_cov(query_hashes, sig_hashes,
+                                              n_threshold_hashes):
+            match, location = signatures[dataset_id]
+            cont = qmh.contained_by(match.minhash, True)
+            results.append((cont, match.md5sum(), match, location))
+
+        results.sort(reverse=True, key=itemgetter(0, 1))
+
+        return [ (cont, ss, loc) for (cont, _, ss, loc) in results ]
 
     @abstractmethod
     def select(self, ksize=None, moltype=None, scaled=None, num=None,
@@ -177,22 +301,108 @@ def select_signature(ss, ksize=None, moltype=None, scaled=0, num=0,
     return True
 
 
+def _greedy_min_set_cov(query_hashes, sig_hashes, n_threshold_hashes=0):
+    """Greedily cover 'query_hashes' with the hash arrays in 'sig_hashes'.
+
+    'query_hashes' is a numpy uint64 array or an iterable of hashes, and
+    'sig_hashes' is a list of numpy uint64 arrays. Returns a list of the indices in
+    'sig_hashes' of each pick, in order, until no array has at least
+    'n_threshold_hashes' hashes in common with the part of the query that
+    is still uncovered.
+
+    Note that intersecting the raw hashes is the same as downsampling to
+    the larger of the two scaled values.
+    """
+    import numpy as np
+    from ._lowlevel import ffi, lib
+    from .utils import rustcall
+
+    # arrays (e.g. from MinHash._hashes_array()) are passed on as-is; the
+    # Rust side builds a set from the query, so they needn't be unique.
+    if isinstance(query_hashes, np.ndarray):
+        query_arr = np.ascontiguousarray(query_hashes, dtype=np.uint64)
+    else:
+        query_arr = np.fromiter(query_hashes, dtype=np.uint64)
+    if not len(query_arr) or not sig_hashes:
+        return []
+
+    # the set cover itself runs in Rust, directly on the numpy buffers.
+    sig_hashes = [ np.ascontiguousarray(x, dtype=np.uint64)
+                   for x in sig_hashes ]
+    sig_bufs = [ ffi.from_buffer("uint64_t[]", x) for x in sig_hashes ]
+    sigs_c = ffi.new("uint64_t*[]", sig_bufs)
+    sizes_c = ffi.new("uintptr_t[]", [ len(x) for x in sig_hashes ])
+
+    size = ffi.new("uintptr_t *")
+    picks_ptr = rustcall(lib.greedy_min_set_cov,
+                         ffi.from_buffer("uint64_t[]", query_arr),
+                         len(query_arr), sigs_c, sizes_c, len(sig_hashes),
+                         float(n_threshold_hashes), size)
+    size = size[0]
+
+    try:
+        return [ picks_ptr[i] for i in range(size) ]
+    finally:
+        lib.kmerminhash_slice_free(picks_ptr, size)
+
+
 class LinearIndex(Index):
-    "An Index for a collection of signatures. Can load from a .sig file."
-    def __init__(self, _signatures=None, filename=None):
+    """An Index for a collection of signatures. Can load from a .sig file.
+
+    If '_locations' is provided, it must be a list parallel to the
+    signatures; each entry overrides 'filename' as the location reported
+    for that signature by search and gather.
+    """
+    def __init__(self, _signatures=None, filename=None, _locations=None):
         self._signatures = []
         if _signatures:
             self._signatures = list(_signatures)
         self.location = filename
+        self._metadata = None
+
+        self._locations = None
+        if _locations is not None:
+            self._locations = list(_locations)
+            assert len(self._locations) == len(self._signatures)
 
     def signatures(self):
         return iter(self._signatures)
 
+    def signatures_with_location(self):
+        if self._locations is not None:
+            return zip(self._signatures, self._locations)
+        return zip(self._signatures, itertools.repeat(self.location))
+
     def __len__(self):
         return len(self._signatures)
 
     def insert(self, node):
         self._signatures.append(node)
+        if self._locations is not None:
+            self._locations.append(self.location)
+        self._metadata = None
+
+    def _get_metadata(self):
+        """Return arrays of (ksize, moltype, scaled, num) for all signatures.
+
+        These are built once, so that 'select' does not need to look up
+        each attribute on each MinHash again.
+        """
+        if self._metadata is None:
+            import numpy as np
+
+            n = len(self._signatures)
+            mhs = [ ss.minhash for ss in self._signatures ]
+            ksizes = np.fromiter((mh.ksize for mh in mhs), dtype=np.int64,
+                                 count=n)
+            moltypes = np.array([ mh.moltype for mh in mhs ], dtype=object)
+            scaleds = np.fromiter((mh.scaled for mh in mhs), dtype=np.uint64,
+                                  count=n)
+            nums = np.fromiter((mh.num for mh in mhs), dtype=np.int64,
+                               count=n)
+            self._metadata = (ksizes, moltypes, scaleds, nums)
+
+        return self._metadata
 
     def save(self, path):
         from .signature import save_signatures
@@ -212,15 +422,46 @@ class LinearIndex(Index):
 
         Does not raise ValueError, but may return an empty Index.
         """
-        # eliminate things from kwargs with None or zero value
-        kw = { k : v for (k, v) in kwargs.items() if v }
+        return self._select(**kwargs)
 
-        siglist = []
-        for ss in self._signatures:
-            if select_signature(ss, **kwargs):
-                siglist.append(ss)
+    def _select(self, ksize=None, moltype=None, scaled=0, num=0,
+                containment=False):
+        "Select on the metadata arrays; same rules as 'select_signature'."
+        import numpy as np
+
+        ksizes, moltypes, scaleds, nums = self._get_metadata()
+        mask = np.ones(len(self._signatures), dtype=bool)
+
+        # ksize match?
+        if ksize:
+            mask &= ksizes == ksize
+
+        # moltype match?
+        if moltype:
+            mask &= moltypes == moltype
+
+        # containment requires scaled; similarity does not.
+        if containment:
+            if not scaled:
+                raise ValueError("'containment' requires 'scaled' in Index.select'")
+            mask &= scaleds != 0
 
-        return LinearIndex(siglist, self.location)
+        # 'scaled' and 'num' are incompatible
+        if scaled:
+            mask &= nums == 0
+        if num:
+            mask &= (scaleds == 0) & (nums == num)
+
+        keep = np.flatnonzero(mask)
+        siglist = [ self._signatures[i] for i in keep ]
+
+        locations = None
+        if self._locations is not None:
+            locations = [ self._locations[i] for i in keep ]
+
+        new_idx = LinearIndex(siglist, self.location, _locations=locations)
+        new_idx._metadata = tuple( x[mask] for x in self._metadata )
+        return new_idx
 
 
 class ZipFileLinearIndex(Index):
@@ -230,6 +471,7 @@ class ZipFileLinearIndex(Index):
     Does not support `insert` or `save`.
     """
     is_database = True
+    n_prefetch = 4
 
     def __init__(self, zf, selection_dict=None,
                  traverse_yield_all=False):
@@ -237,9 +479,6 @@ class ZipFileLinearIndex(Index):
         self.selection_dict = selection_dict
         self.traverse_yield_all = traverse_yield_all
 
-    def __len__(self):
-        return len(list(self.signatures()))
-
     @property
     def location(self):
         return self.zf.filename
@@ -256,27 +495,80 @@ class ZipFileLinearIndex(Index):
         zf = zipfile.ZipFile(location, 'r')
         return cls(zf, traverse_yield_all=traverse_yield_all)
 
+    def _load_kwargs(self):
+        """Selection arguments that can be passed on to 'load_signatures'.
+
+        The JSON is parsed in Rust, which can skip sketches that don't match
+        on moltype; this avoids building Python objects for them. 'ksize'
+        is only passed on for DNA, since Rust uses 3*k for protein ksizes.
+        'select_signature' is still applied to everything that is loaded.
+        """
+        kwargs = {}
+        if self.selection_dict:
+            moltype = self.selection_dict.get('moltype')
+            if moltype in ('DNA', 'protein', 'dayhoff', 'hp'):
+                kwargs['select_moltype'] = moltype
+                ksize = self.selection_dict.get('ksize')
+                if moltype == 'DNA' and ksize:
+                    kwargs['ksize'] = ksize
+        return kwargs
+
+    def _load_member(self, zf, zipinfo, load_kwargs):
+        "Decompress and parse all signatures in one zip file member."
+        from .signature import load_signatures
+
+        # note: if the member doesn't contain a valid JSON signature,
+        # load_signatures will silently fail & yield nothing.
+        fp = io.BytesIO(zf.read(zipinfo))
+        return list(load_signatures(fp, **load_kwargs))
+
     def signatures(self):
         "Load all signatures in the zip file."
-        from .signature import load_signatures
-        for zipinfo in self.zf.infolist():
-            # should we load this file? if it ends in .sig OR we are forcing:
-            if zipinfo.filename.endswith('.sig') or \
-               zipinfo.filename.endswith('.sig.gz') or \
-               self.traverse_yield_all:
-                fp = self.zf.open(zipinfo)
-
-                # now load all the signatures and select on ksize/moltype:
-                selection_dict = self.selection_dict
-
-                # note: if 'fp' doesn't contain a valid JSON signature,
-                # load_signatures will silently fail & yield nothing.
-                for ss in load_signatures(fp):
-                    if selection_dict:
-                        if select_signature(ss, **self.selection_dict):
+        load_kwargs = self._load_kwargs()
+
+        # should we load this file? if it ends in .sig OR we are forcing:
+        zipinfos = [ zipinfo for zipinfo in self.zf.infolist()
+                     if zipinfo.filename.endswith('.sig') or
+                        zipinfo.filename.endswith('.sig.gz') or
+                        self.traverse_yield_all ]
+
+        # reading from a shared ZipFile in several threads isn't safe, so
+        # each worker thread opens its own handle on the zip file.
+        local = threading.local()
+        handles = []
+
+        def load_member(zipinfo):
+            zf = getattr(local, 'zf', None)
+            if zf is None:
+                zf = local.zf = zipfile.ZipFile(self.zf.filename, 'r')
+                handles.append(zf)
+            return self._load_member(zf, zipinfo, load_kwargs)
+
+        # decompress & parse the next few members in the background while
+        # the caller works on the current one.
+        try:
+            with ThreadPoolExecutor(max_workers=self.n_prefetch) as executor:
+                pending = deque()
+                zipinfos = iter(zipinfos)
+                for zipinfo in itertools.islice(zipinfos, self.n_prefetch):
+                    pending.append(executor.submit(load_member, zipinfo))
+
+                while pending:
+                    siglist = pending.popleft().result()
+                    for zipinfo in itertools.islice(zipinfos, 1):
+                        pending.append(executor.submit(load_member, zipinfo))
+
+                    # now select on ksize/moltype:
+                    selection_dict = self.selection_dict
+                    for ss in siglist:
+                        if selection_dict:
+                            if select_signature(ss, **selection_dict):
+                                yield ss
+                        else:
                             yield ss
-                    else:
-                        yield ss
+        finally:
+            for zf in handles:
+                zf.close()
 
     def select(self, **kwargs):
         "Select signatures in zip file based on ksize/moltype/etc."
@@ -307,9 +599,12 @@ class MultiIndex(Index):
                 yield ss
 
     def signatures_with_location(self):
-        for idx, loc in zip(self.index_list, self.source_list):
-            for ss in idx.signatures():
-                yield ss, loc
+        for idx, src in zip(self.index_list, self.source_list):
+            if src:                       # override if src provided
+                for ss in idx.signatures():
+                    yield ss, src
+            else:
+                yield from idx.signatures_with_location()
 
     def __len__(self):
         return sum([ len(idx) for idx in self.index_list ])
@@ -317,6 +612,20 @@ class MultiIndex(Index):
     def insert(self, *args):
         raise NotImplementedError
 
+    def flatten(self):
+        """Return a LinearIndex holding all signatures in this MultiIndex.
+
+        This loads everything into memory, but then searches run as a
+        single pass over one list. Locations are kept per signature.
+        """
+        siglist = []
+        locations = []
+        for ss, loc in self.signatures_with_location():
+            siglist.append(ss)
+            locations.append(loc)
+
+        return LinearIndex(siglist, _locations=locations)
+
     @classmethod
     def load(self, *args):
         raise NotImplementedError
@@ -393,26 +702,50 @@ class MultiIndex(Index):
         return MultiIndex(new_idx_list, new_src_list)
 
     def search(self, query, *args, **kwargs):
-        # do the actual search:
-        matches = []
-        for idx, src in zip(self.index_list, self.source_list):
-            for (score, ss, filename) in idx.search(query, *args, **kwargs):
+        # do the actual search on each index in parallel; the MinHash
+        # comparisons are done in Rust, which releases the GIL.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [ executor.submit(idx.search, query, *args, **kwargs)
+                        for idx in self.index_list ]
+
+        # sort each result list; this is cheap for indices that already
+        # return sorted results.
+        per_idx_matches = []
+        for future, src in zip(futures, self.source_list):
+            matches = []
+            for (score, ss, filename) in future.result():
                 best_src = src or filename # override if src provided
                 matches.append((score, ss, best_src))
-                
-        # sort!
-        matches.sort(key=lambda x: -x[0])
-        return matches
+            matches.sort(key=lambda x: -x[0])
+            per_idx_matches.append(matches)
+
+        # merge the sorted lists.
+        matches = heapq.merge(*per_idx_matches, key=lambda x: -x[0])
+
+        # not all Index classes support 'top_n', so truncate here too.
+        top_n = kwargs.get('top_n')
+        if top_n:
+            matches = itertools.islice(matches, top_n)
+
+        return list(matches)
 
     def gather(self, query, *args, **kwargs):
         "Return the match with the best Jaccard containment in the Index."
-        # actually do search!
-        results = []
-        for idx, src in zip(self.index_list, self.source_list):
-            for (score, ss, filename) in idx.gather(query, *args, **kwargs):
+        # actually do search, in parallel across indices!
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = [ executor.submit(idx.gather, query, *args, **kwargs)
+                        for idx in self.index_list ]
+
+        per_idx_results = []
+        for future, src in zip(futures, self.source_list):
+            results = []
+            for (score, ss, filename) in future.result():
                 best_src = src or filename # override if src provided
-                results.append((score, ss, best_src))
-            
-        results.sort(reverse=True, key=lambda x: (x[0], x[1].md5sum()))
+                results.append((score, ss.md5sum(), ss, best_src))
+            results.sort(reverse=True, key=itemgetter(0, 1))
+            per_idx_results.append(results)
+
+        results = heapq.merge(*per_idx_results, reverse=True,
+                              key=itemgetter(0, 1))
 
-        return results
+        return [ (score, ss, loc) for (score, _, ss, loc) in results ]
@@ -165,12 +165,19 @@ class LCA_Database(Index):
     def __repr__(self):
         return "LCA_Database('{}')".format(self.filename)
 
+    def __len__(self):
+        return len(self.ident_to_idx)
+
     def signatures(self):
         "Return all of the signatures in this LCA database."
         from sourmash import SourmashSignature
         for v in self._signatures.values():
             yield v
 
+    def signatures_with_location(self):
+        for v in self._signatures.values():
+            yield v, self.filename
+
     def select(self, ksize=None, moltype=None, num=0, scaled=0,
                containment=False):
         """Make sure this database matches the requested requirements.
@@ -317,7 +324,8 @@ class LCA_Database(Index):
             json.dump(save_d, fp)
 
     def search(self, query, threshold=None, do_containment=False,
-               do_max_containment=False, ignore_abundance=False, **kwargs):
+               do_max_containment=False, ignore_abundance=False, top_n=None,
+               **kwargs):
         """Return set of matches with similarity above 'threshold'.
 
         Results will be sorted by similarity, highest to lowest.
@@ -329,6 +337,8 @@ class LCA_Database(Index):
             is guaranteed to be best.
           * ignore_abundance: default False. If True, and query signature
             and database support k-mer abundances, ignore those abundances.
+          * top_n: default None. If set, return only the 'top_n' best
+            matches.
 
         Note, the "best only" hint is ignored by LCA_Database
         """
@@ -352,6 +362,10 @@ class LCA_Database(Index):
             results.append((score, match, filename))
 
         results.sort(key=lambda x: -x[0])
+
+        # only keep the best 'top_n' matches, if requested.
+        if top_n:
+            return results[:top_n]
         return results
 
     def gather(self, query, *args, **kwargs):
@@ -354,6 +354,19 @@ class MinHash(RustObject):
         finally:
             lib.kmerminhash_slice_free(mins_ptr, size)
 
+    def _hashes_array(self):
+        "Return a numpy uint64 array of the hashes, ignoring abundances."
+        import numpy as np
+
+        size = ffi.new("uintptr_t *")
+        mins_ptr = self._methodcall(lib.kmerminhash_get_mins, size)
+        size = size[0]
+
+        try:
+            buf = ffi.buffer(mins_ptr, size * ffi.sizeof("uint64_t"))
+            return np.frombuffer(buf, dtype=np.uint64).copy()
+        finally:
+            lib.kmerminhash_slice_free(mins_ptr, size)
 
     @property
     def seed(self):
@@ -528,6 +541,35 @@ class MinHash(RustObject):
                                 other._get_objptr(),
                                 ignore_abundance, downsample)
 
+    def similarity_many(self, others, ignore_abundance=False,
+                        downsample=False):
+        """Calculate the similarity of this sketch with each of ``others``.
+
+        This is the same as calling ``similarity`` on each one, but does
+        all of the comparisons in a single call into the Rust library.
+
+        Returns a numpy array of floats, in the same order as ``others``.
+        """
+        import numpy as np
+
+        others = list(others)
+        if not others:
+            return np.zeros(0, dtype=np.float64)
+
+        for other in others:
+            if not isinstance(other, MinHash):
+                raise TypeError("Must be a MinHash!")
+
+        n = len(others)
+        others_c = ffi.new("SourmashKmerMinHash*[]",
+                           [ other._get_objptr() for other in others ])
+        output = ffi.new("double[]", n)
+        self._methodcall(lib.kmerminhash_similarity_many, others_c, n,
+                         ignore_abundance, downsample, output)
+
+        buf = ffi.buffer(output, n * ffi.sizeof("double"))
+        return np.frombuffer(buf, dtype=np.float64).copy()
+
     def angular_similarity(self, other):
         "Calculate the angular similarity."
         return self._methodcall(lib.kmerminhash_angular_similarity,
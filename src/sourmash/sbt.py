@@ -46,6 +46,7 @@ from collections import namedtuple, Counter
 from collections.abc import Mapping
 
 from copy import copy
+import heapq
 import json
 import math
 import os
@@ -190,6 +191,10 @@ class SBT(Index):
         for k in self.leaves():
             yield k.data
 
+    def signatures_with_location(self):
+        for k in self.leaves():
+            yield k.data, self._location
+
     def select(self, ksize=None, moltype=None, num=0, scaled=0,
                containment=False):
         """Make sure this database matches the requested requirements.
@@ -382,7 +387,7 @@ class SBT(Index):
     def search(self, query, threshold=None,
                ignore_abundance=False, do_containment=False,
                do_max_containment=False, best_only=False,
-               unload_data=False, **kwargs):
+               unload_data=False, top_n=None, **kwargs):
         """Return set of matches with similarity above 'threshold'.
 
         Results will be sorted by similarity, highest to lowest.
@@ -394,6 +399,8 @@ class SBT(Index):
             is guaranteed to be best.
           * ignore_abundance: default False. If True, and query signature
             and database support k-mer abundances, ignore those abundances.
+          * top_n: default None. If set, return only the 'top_n' best
+            matches.
         """
         from .sbtmh import (search_minhashes, search_minhashes_containment,
                             search_minhashes_max_containment)
@@ -449,6 +456,10 @@ class SBT(Index):
 
             results.append((similarity, leaf.data, self._location))
 
+        # only keep the best 'top_n' matches, if requested.
+        if top_n:
+            return heapq.nlargest(top_n, results, key=lambda x: x[0])
+
         return results
         
 
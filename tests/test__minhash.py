@@ -436,6 +436,41 @@ def test_mh_similarity_downsample_true(track_abundance):
     assert x == y
 
 
+def test_mh_similarity_many(track_abundance):
+    # similarity_many should match similarity on each sketch
+    a = MinHash(0, 20, scaled=scaled50, track_abundance=track_abundance)
+    b = MinHash(0, 20, scaled=scaled100, track_abundance=track_abundance)
+    c = MinHash(0, 20, scaled=scaled50, track_abundance=track_abundance)
+
+    a_values = { 1:5, 3:3, 5:2, 8:2}
+    b_values = { 1:3, 3:2, 5:1, 6:1, 8:1, 10:1 }
+    c_values = { 2:1, 4:1 }
+    for mh, values in ((a, a_values), (b, b_values), (c, c_values)):
+        if track_abundance:
+            mh.set_abundances(values)
+        else:
+            mh.add_many(values.keys())
+
+    others = [a, b, c]
+    for ignore_abundance in (True, False):
+        sims = a.similarity_many(others, ignore_abundance=ignore_abundance,
+                                 downsample=True)
+        assert len(sims) == 3
+        for sim, other in zip(sims, others):
+            assert sim == a.similarity(other, downsample=True,
+                                       ignore_abundance=ignore_abundance)
+
+    assert len(a.similarity_many([])) == 0
+
+    with pytest.raises(TypeError):
+        a.similarity_many([a, 'foo'])
+
+    # errors are raised the same way as 'similarity'
+    with pytest.raises(ValueError) as e:
+        a.similarity_many(others)                # downsample=False
+    assert 'mismatch in scaled; comparison fail' in str(e.value)
+
+
 def test_mh_similarity_downsample_errors(track_abundance):
     # test downsample=False (default) argument to MinHash.similarity
 
@@ -1436,6 +1471,19 @@ def test_try_change_hashes(track_abundance):
         h[5] = 10
 
 
+def test_hashes_array(track_abundance):
+    a = MinHash(0, 10, track_abundance=track_abundance, scaled=scaled5000)
+    assert len(a._hashes_array()) == 0
+
+    a.add_many(list(range(0, 100, 2)))
+    if track_abundance:
+        a.add_hash(10)
+
+    arr = a._hashes_array()
+    assert arr.dtype.name == 'uint64'
+    assert list(arr) == sorted(a.hashes)
+
+
 def test_flatten():
     # test behavior with scaled
     scaled = _get_scaled_for_max_hash(35)
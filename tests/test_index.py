@@ -8,7 +8,7 @@ import zipfile
 import shutil
 
 import sourmash
-from sourmash import load_one_signature, SourmashSignature
+from sourmash import load_one_signature, SourmashSignature, MinHash
 from sourmash.index import (LinearIndex, MultiIndex, ZipFileLinearIndex)
 from sourmash.sbt import SBT, GraphFactory, Leaf
 from sourmash import sourmash_args
@@ -118,6 +118,50 @@ def test_linear_index_search():
     assert sr[0][1] == ss63
 
 
+def test_linear_index_search_top_n():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss2 = sourmash.load_one_signature(sig2, ksize=31)
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx = LinearIndex()
+    lidx.insert(ss2)
+    lidx.insert(ss47)
+    lidx.insert(ss63)
+
+    sr = lidx.search(ss47, threshold=0.0)
+    assert len(sr) == 3
+
+    sr_top = lidx.search(ss47, threshold=0.0, top_n=2)
+    assert len(sr_top) == 2
+    assert sr_top == sr[:2]
+    assert sr_top[0][1] == ss47
+    assert sr_top[1][1] == ss63
+
+
+def test_linear_index_find_generator():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss2 = sourmash.load_one_signature(sig2, ksize=31)
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx = LinearIndex([ss2, ss47, ss63])
+
+    match_all = lambda x: True
+    assert list(lidx.find(match_all)) == [ss2, ss47, ss63]
+
+    # 'find' is lazy, so callers can stop early.
+    results = lidx.find(match_all)
+    assert next(results) == ss2
+    assert list(lidx.find(match_all, limit=2)) == [ss2, ss47]
+
+
 def test_linear_index_gather():
     sig2 = utils.get_test_data('2.fa.sig')
     sig47 = utils.get_test_data('47.fa.sig')
@@ -145,6 +189,187 @@ def test_linear_index_gather():
     assert matches[1][1] == ss63
 
 
+def test_linear_index_counter_gather():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss2 = sourmash.load_one_signature(sig2, ksize=31)
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx = LinearIndex(filename='foo')
+    lidx.insert(ss2)
+    lidx.insert(ss47)
+    lidx.insert(ss63)
+
+    matches = lidx.counter_gather(ss2)
+    assert len(matches) == 1
+    assert matches[0][0] == 1.0
+    assert matches[0][1] == ss2
+    assert matches[0][2] == 'foo'
+
+    # ss47 covers all of the query, so ss63 is never picked.
+    matches = lidx.counter_gather(ss47)
+    assert len(matches) == 1
+    assert matches[0][0] == 1.0
+    assert matches[0][1] == ss47
+
+    # a combined query needs both ss47 and ss63 to be covered.
+    combined_mh = ss47.minhash + ss63.minhash
+    matches = lidx.counter_gather(SourmashSignature(combined_mh))
+    assert len(matches) == 2
+    assert {matches[0][1], matches[1][1]} == {ss47, ss63}
+    assert matches[0][0] >= matches[1][0]
+
+    # with a threshold above the size of the query, nothing is found.
+    matches = lidx.counter_gather(ss47, threshold_bp=1e9)
+    assert not matches
+
+
+def test_linear_index_counter_gather_empty_sig():
+    # signatures with no hashes should not disturb the per-signature counts
+    sig2 = load_one_signature(utils.get_test_data('2.fa.sig'), ksize=31)
+    sig47 = load_one_signature(utils.get_test_data('47.fa.sig'), ksize=31)
+    empty = SourmashSignature(sig2.minhash.copy_and_clear(), name='empty')
+
+    lidx = LinearIndex()
+    lidx.insert(empty)
+    lidx.insert(sig2)
+    lidx.insert(empty)
+    lidx.insert(sig47)
+
+    matches = lidx.counter_gather(sig47)
+    assert len(matches) == 1
+    assert matches[0][0] == 1.0
+    assert matches[0][1] == sig47
+
+
+def test_linear_index_counter_gather_threshold():
+    sig47 = load_one_signature(utils.get_test_data('47.fa.sig'), ksize=31)
+    sig63 = load_one_signature(utils.get_test_data('63.fa.sig'), ksize=31)
+
+    lidx = LinearIndex()
+    lidx.insert(sig47)
+    lidx.insert(sig63)
+
+    combined_mh = sig47.minhash + sig63.minhash
+    combined = SourmashSignature(combined_mh)
+    scaled = combined_mh.scaled
+
+    # sig63 is picked first; after that, sig47 only has its unique
+    # hashes left.
+    matches = lidx.counter_gather(combined)
+    assert len(matches) == 2
+    assert len(sig63.minhash) > len(sig47.minhash)
+
+    n_unique_47 = len(set(sig47.minhash.hashes) - set(sig63.minhash.hashes))
+
+    matches = lidx.counter_gather(combined,
+                                  threshold_bp=n_unique_47 * scaled)
+    assert len(matches) == 2
+
+    matches = lidx.counter_gather(combined,
+                                  threshold_bp=(n_unique_47 + 1) * scaled)
+    assert len(matches) == 1
+    assert matches[0][1] == sig63
+
+
+def test_greedy_min_set_cov_hashes():
+    # run the greedy min-set-cov on plain hash arrays
+    import numpy as np
+    from sourmash.index import _greedy_min_set_cov
+
+    sig_hashes = [ np.array([1, 2], dtype=np.uint64),
+                   np.array([1, 2, 3, 4], dtype=np.uint64),
+                   np.array([], dtype=np.uint64),
+                   np.array([4, 5, 6], dtype=np.uint64),
+                   np.array([7, 8], dtype=np.uint64) ]
+    query_hashes = {1, 2, 3, 4, 5, 6}
+
+    picks = list(_greedy_min_set_cov(query_hashes, sig_hashes))
+    assert picks == [1, 3]
+
+    # after the first pick, [4, 5, 6] only has 2 uncovered hashes left.
+    picks = list(_greedy_min_set_cov(query_hashes, sig_hashes, 3))
+    assert picks == [1]
+
+    assert not list(_greedy_min_set_cov(query_hashes, []))
+
+    # the query can also be given as a uint64 array, even with duplicates.
+    query_arr = np.array(sorted(query_hashes), dtype=np.uint64)
+    picks = list(_greedy_min_set_cov(query_arr, sig_hashes))
+    assert picks == [1, 3]
+
+    query_arr = np.concatenate((query_arr, query_arr[::-1]))
+    picks = list(_greedy_min_set_cov(query_arr, sig_hashes))
+    assert picks == [1, 3]
+
+    # ties are broken by position.
+    sig_hashes = [ np.array([3, 4], dtype=np.uint64),
+                   np.array([1, 2], dtype=np.uint64),
+                   np.array([2, 3], dtype=np.uint64) ]
+    picks = list(_greedy_min_set_cov({1, 2, 3, 4}, sig_hashes))
+    assert picks == [0, 1]
+
+
+def test_greedy_min_set_cov_shared_non_query_hashes():
+    # signatures that share hashes outside of the query must not count
+    # those shared hashes as query hits.
+    import numpy as np
+    from sourmash.index import _greedy_min_set_cov
+
+    rng = np.random.RandomState(2)
+    hashes = np.unique(rng.randint(0, 2**63, 1000, dtype=np.int64)
+                       .astype(np.uint64) * np.uint64(2))
+    query_hashes, other = hashes[:200], hashes[200:500]
+
+    sig_hashes = [ query_hashes[:50],
+                   np.sort(np.concatenate((query_hashes[50:60], other))),
+                   np.sort(np.concatenate((query_hashes[60:70], other))) ]
+
+    picks = list(_greedy_min_set_cov(query_hashes, sig_hashes))
+    assert picks == [0, 1, 2]
+
+    picks = list(_greedy_min_set_cov(query_hashes, sig_hashes, 11))
+    assert picks == [0]
+
+
+def test_greedy_min_set_cov_random():
+    # compare against a naive set-based greedy min-set-cov.
+    import numpy as np
+    from sourmash.index import _greedy_min_set_cov
+
+    # draw from the full uint64 range, so that numpy uses its sort-based
+    # isin; half of the pool is outside of the query, and is shared
+    # between signatures.
+    rng = np.random.RandomState(1)
+    pool = np.unique(rng.randint(0, 2**63, 200, dtype=np.int64)
+                     .astype(np.uint64) * np.uint64(2))
+    query_hashes = set(pool[::2].tolist())
+    sig_hashes = []
+    for i in range(20):
+        size = rng.randint(0, 50)
+        sig_hashes.append(np.unique(rng.choice(pool, size)))
+
+    def naive(query, threshold):
+        query = set(query)
+        remaining = [ set(x.tolist()) for x in sig_hashes ]
+        while True:
+            sizes = [ len(query & x) for x in remaining ]
+            best = max(sizes)
+            if not best or best < threshold:
+                return
+            dataset_id = sizes.index(best)
+            yield dataset_id
+            query -= remaining[dataset_id]
+
+    for threshold in (0, 5, 10):
+        picks = list(_greedy_min_set_cov(query_hashes, sig_hashes, threshold))
+        assert picks == list(naive(query_hashes, threshold))
+        assert picks
+
+
 def test_linear_index_save():
     sig2 = utils.get_test_data('2.fa.sig')
     sig47 = utils.get_test_data('47.fa.sig')
@@ -323,6 +548,50 @@ def test_linear_gather_threshold_5():
     assert name == 'foo'
 
 
+def test_linear_gather_threshold_small_sig():
+    # signatures too small to meet the threshold are skipped; those right
+    # at the threshold, including ones that need downsampling, are not.
+    sig2 = load_one_signature(utils.get_test_data('2.fa.sig'), ksize=31)
+    sig47 = load_one_signature(utils.get_test_data('47.fa.sig'), ksize=31)
+
+    mh_10k = sig2.minhash.downsample(scaled=10000)
+    sig2_10k = SourmashSignature(mh_10k, name='sig2_10k')
+
+    linear = LinearIndex()
+    linear.insert(sig47)
+    linear.insert(sig2_10k)
+
+    scaled = sig2.minhash.scaled
+    results = linear.gather(sig2, threshold_bp=len(mh_10k) * scaled)
+    assert len(results) == 1
+    containment, match_sig, name = results[0]
+    assert containment == len(mh_10k) / len(sig2.minhash)
+    assert match_sig == sig2_10k
+
+    results = linear.gather(sig2, threshold_bp=(len(mh_10k) + 1) * scaled)
+    assert not results
+
+
+def test_linear_gather_threshold_exact():
+    # a signature exactly at the threshold is kept, even where
+    # (7/25)*25 rounds up to more than 7.
+    query_mh = MinHash(0, 31, scaled=1)
+    query_mh.add_many(range(1, 26))
+    match_mh = MinHash(0, 31, scaled=1)
+    match_mh.add_many(range(1, 8))
+
+    query = SourmashSignature(query_mh, name='query')
+    match = SourmashSignature(match_mh, name='match')
+    linear = LinearIndex([match])
+
+    results = linear.gather(query, threshold_bp=7)
+    assert len(results) == 1
+    assert results[0][0] == 7 / 25
+    assert results[0][1] == match
+
+    assert not linear.gather(query, threshold_bp=8)
+
+
 def test_linear_index_multik_select():
     # this loads three ksizes, 21/31/51
     sig2 = utils.get_test_data('2.fa.sig')
@@ -371,6 +640,26 @@ def test_linear_index_moltype_select():
     assert len(linear2) == 0
 
 
+def test_linear_index_select_insert_chain():
+    # selection should stay correct across 'insert' and chained 'select'
+    sig2 = utils.get_test_data('2.fa.sig')
+    siglist = list(sourmash.load_file_as_signatures(sig2))
+    sig47 = load_one_signature(utils.get_test_data('47.fa.sig'), ksize=31)
+
+    linear = LinearIndex(siglist)
+    assert len(linear.select(ksize=31)) == 1
+
+    linear.insert(sig47)
+    linear2 = linear.select(ksize=31)
+    assert len(linear2) == 2
+    assert sig47 in list(linear2.signatures())
+
+    linear3 = linear2.select(moltype='DNA', scaled=1000)
+    assert len(linear3) == 2
+    assert len(linear3.select(num=500)) == 0
+    assert len(linear3.select(ksize=21)) == 0
+
+
 @utils.in_tempdir
 def test_index_same_md5sum_fsstorage(c):
     testdata1 = utils.get_test_data('img/2706795855.sig')
@@ -535,6 +824,67 @@ def test_zipfile_API_signatures_traverse_yield_all_select():
     assert len(zipidx) == 2
 
 
+def test_zipfile_API_signatures_prefetch():
+    # background loading should not change the order of signatures
+    zipfile_db = utils.get_test_data('prot/all.zip')
+
+    zipidx = ZipFileLinearIndex.load(zipfile_db, traverse_yield_all=True)
+    siglist = list(zipidx.signatures())
+
+    zipidx.n_prefetch = 1
+    assert list(zipidx.signatures()) == siglist
+
+    zipidx.n_prefetch = 20
+    assert list(zipidx.signatures()) == siglist
+
+    # stopping early is fine, too.
+    assert next(iter(zipidx.signatures())) == siglist[0]
+
+
+def test_zipfile_API_signatures_prefetch_handles():
+    # worker threads read through their own ZipFile handles, which are
+    # closed afterwards; the index's own handle is left open.
+    zipfile_db = utils.get_test_data('prot/all.zip')
+
+    zipidx = ZipFileLinearIndex.load(zipfile_db, traverse_yield_all=True)
+
+    handles = []
+    load_member = zipidx._load_member
+    def record_member(zf, zipinfo, load_kwargs):
+        handles.append(zf)
+        return load_member(zf, zipinfo, load_kwargs)
+    zipidx._load_member = record_member
+
+    siglist = list(zipidx.signatures())
+    assert len(siglist) == 8
+    assert handles
+    assert all(zf is not zipidx.zf for zf in handles)
+    assert all(zf.fp is None for zf in handles)     # closed
+
+    # stopping early closes the worker handles, too.
+    handles.clear()
+    gen = zipidx.signatures()
+    next(gen)
+    gen.close()
+    assert all(zf.fp is None for zf in handles)
+
+    assert zipidx.zf.fp is not None
+    assert len(list(zipidx.signatures())) == 8
+
+
+def test_zipfile_API_len_select():
+    # length is cached per object; 'select' returns a new object.
+    zipfile_db = utils.get_test_data('prot/all.zip')
+
+    zipidx = ZipFileLinearIndex.load(zipfile_db, traverse_yield_all=True)
+    assert len(zipidx) == 8
+    assert len(zipidx) == 8
+
+    dna_idx = zipidx.select(moltype='DNA')
+    assert len(dna_idx) == 2
+    assert len(zipidx) == 8
+
+
 def test_zipfile_API_signatures_select():
     # include dna-sig.noext
     zipfile_db = utils.get_test_data('prot/all.zip')
@@ -546,6 +896,17 @@ def test_zipfile_API_signatures_select():
     assert len(zipidx) == 1
 
 
+def test_zipfile_API_signatures_select_ksize_moltype():
+    # ksize and moltype selection together, for DNA and protein
+    zipfile_db = utils.get_test_data('prot/all.zip')
+
+    zipidx = ZipFileLinearIndex.load(zipfile_db, traverse_yield_all=True)
+    assert len(zipidx.select(ksize=31, moltype='DNA')) == 2
+    assert len(zipidx.select(ksize=21, moltype='DNA')) == 0
+    assert len(zipidx.select(ksize=19, moltype='protein')) == 2
+    assert len(zipidx.select(ksize=57, moltype='protein')) == 0
+
+
 def test_zipfile_API_save():
     zipfile_db = utils.get_test_data('prot/all.zip')
 
@@ -668,6 +1029,27 @@ def test_multi_index_search():
     assert sr[0][2] == 'C'      # source override
 
 
+def test_multi_index_search_top_n():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx1 = LinearIndex.load(sig2)
+    lidx2 = LinearIndex.load(sig47)
+    lidx3 = LinearIndex.load(sig63)
+
+    lidx = MultiIndex([lidx1, lidx2, lidx3], ['A', None, 'C'])
+    lidx = lidx.select(ksize=31)
+
+    sr = lidx.search(ss47, threshold=0.0, top_n=1)
+    assert len(sr) == 1
+    assert sr[0][1] == ss47
+    assert sr[0][2] == sig47
+
+
 def test_multi_index_gather():
     sig2 = utils.get_test_data('2.fa.sig')
     sig47 = utils.get_test_data('47.fa.sig')
@@ -700,6 +1082,96 @@ def test_multi_index_gather():
     assert matches[1][2] == 'C'       # source override
 
 
+def test_multi_index_counter_gather():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss2 = sourmash.load_one_signature(sig2, ksize=31)
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx1 = LinearIndex.load(sig2)
+    lidx2 = LinearIndex.load(sig47)
+    lidx3 = LinearIndex.load(sig63)
+
+    lidx = MultiIndex([lidx1, lidx2, lidx3], ['A', 'B', 'C'])
+    lidx = lidx.select(ksize=31)
+
+    matches = lidx.counter_gather(ss2)
+    assert len(matches) == 1
+    assert matches[0][0] == 1.0
+    assert matches[0][2] == 'A'
+
+    combined_mh = ss47.minhash + ss63.minhash
+    matches = lidx.counter_gather(SourmashSignature(combined_mh))
+    assert len(matches) == 2
+    assert {(m[1], m[2]) for m in matches} == {(ss47, 'B'), (ss63, 'C')}
+
+
+def test_multi_index_flatten():
+    sig2 = utils.get_test_data('2.fa.sig')
+    sig47 = utils.get_test_data('47.fa.sig')
+    sig63 = utils.get_test_data('63.fa.sig')
+
+    ss2 = sourmash.load_one_signature(sig2, ksize=31)
+    ss47 = sourmash.load_one_signature(sig47)
+    ss63 = sourmash.load_one_signature(sig63)
+
+    lidx1 = LinearIndex.load(sig2)
+    lidx2 = LinearIndex.load(sig47)
+    lidx3 = LinearIndex.load(sig63)
+
+    # create MultiIindex with source location override
+    mi = MultiIndex([lidx1, lidx2, lidx3], ['A', None, 'C'])
+    mi = mi.select(ksize=31)
+
+    flat = mi.flatten()
+    assert isinstance(flat, LinearIndex)
+    assert len(flat) == 3
+    assert set(flat.signatures()) == {ss2, ss47, ss63}
+
+    # locations are kept per signature, including through 'select'.
+    for query in (ss2, ss47, ss63):
+        assert flat.search(query, threshold=0.1) == \
+            mi.search(query, threshold=0.1)
+        assert flat.gather(query) == mi.gather(query)
+        assert flat.select(ksize=31).gather(query) == mi.gather(query)
+
+    matches = flat.gather(ss47)
+    assert [ m[2] for m in matches ] == [sig47, 'C']
+
+
+def test_multi_index_flatten_sbt_lca():
+    # flatten keeps the SBT and LCA_Database locations, with and without
+    # a source override.
+    sbt_file = utils.get_test_data('prot/protein.sbt.zip')
+    lca_file = utils.get_test_data('lca/47+63.lca.json')
+    sigfile1 = utils.get_test_data('prot/protein/GCA_001593925.1_ASM159392v1_protein.faa.gz.sig')
+
+    prot_query = sourmash.load_one_signature(sigfile1)
+    dna_query = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
+                                            ksize=31)
+
+    # the LCA database is at scaled=10000, and downsamples queries to that.
+    dna_query = SourmashSignature(dna_query.minhash.downsample(scaled=10000))
+
+    for db_file, query in ((sbt_file, prot_query), (lca_file, dna_query)):
+        db = sourmash.load_file_as_index(db_file)
+        for src in (None, 'B'):
+            mi = MultiIndex([db], [src])
+            flat = mi.flatten()
+            assert len(flat) == 2
+
+            assert flat.search(query, threshold=0.1) == \
+                mi.search(query, threshold=0.1)
+            # SBT and LCA gather only return the best match.
+            assert flat.gather(query)[0] == mi.gather(query)[0]
+
+            locations = { loc for (_, _, loc) in flat.gather(query) }
+            assert locations == { src or db_file }
+
+
 def test_multi_index_signatures():
     sig2 = utils.get_test_data('2.fa.sig')
     sig47 = utils.get_test_data('47.fa.sig')
@@ -59,6 +59,24 @@ def test_api_create_insert():
     assert not lca_db.lid_to_lineage      # no lineage added
 
 
+def test_api_create_insert_len():
+    # len() is cheap, and tracks insert.
+    ss1 = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
+                                      ksize=31)
+    ss2 = sourmash.load_one_signature(utils.get_test_data('63.fa.sig'),
+                                      ksize=31)
+
+    lca_db = sourmash.lca.LCA_Database(ksize=31, scaled=1000)
+    lca_db.insert(ss1)
+    assert len(lca_db) == 1
+
+    lca_db.insert(ss2)
+    assert len(lca_db) == 2
+
+    # counting doesn't rebuild the signatures.
+    assert not hasattr(lca_db, '_cache')
+
+
 def test_api_create_insert_bad_ksize():
     # can we insert a ksize=21 signature into a ksize=31 DB? hopefully not.
     ss = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
@@ -265,6 +283,39 @@ def test_api_create_gather():
     assert match.minhash == ss.minhash
 
 
+def test_api_create_counter_gather():
+    # counter_gather comes from the Index ABC; it should report the same
+    # location as gather.
+    ss47 = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
+                                       ksize=31)
+    ss63 = sourmash.load_one_signature(utils.get_test_data('63.fa.sig'),
+                                       ksize=31)
+
+    filename = utils.get_test_data('lca/47+63.lca.json')
+    db, ksize, scaled = lca_utils.load_single_database(filename)
+
+    combined_mh = ss47.minhash + ss63.minhash
+    results = db.counter_gather(sourmash.SourmashSignature(combined_mh))
+    assert len(results) == 2
+    assert results[0][0] >= results[1][0]
+    assert {m.name for (_, m, _) in results} == {ss47.name, ss63.name}
+    assert [ loc for (_, _, loc) in results ] == [filename, filename]
+
+
+def test_api_search_top_n():
+    ss47 = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
+                                       ksize=31)
+
+    filename = utils.get_test_data('lca/47+63.lca.json')
+    db, ksize, scaled = lca_utils.load_single_database(filename)
+
+    results = db.search(ss47, threshold=0.0, do_containment=True)
+    assert len(results) == 2
+
+    assert db.search(ss47, threshold=0.0, do_containment=True,
+                     top_n=1) == results[:1]
+
+
 def test_api_add_genome_lineage():
     # LCA_Databases can store/retrieve arbitrary lineages/taxonomies.
     ss = sourmash.load_one_signature(utils.get_test_data('47.fa.sig'),
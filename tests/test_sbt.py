@@ -833,6 +833,38 @@ def test_sbt_protein_command_search(c):
     assert 'the recovered matches hit 100.0% of the query' in c.last_result.out
 
 
+def test_sbt_protein_counter_gather():
+    # counter_gather comes from the Index ABC; it should report the same
+    # location as gather.
+    sigfile1 = utils.get_test_data('prot/protein/GCA_001593925.1_ASM159392v1_protein.faa.gz.sig')
+    db_out = utils.get_test_data('prot/protein.sbt.zip')
+
+    query = sourmash.load_one_signature(sigfile1)
+    tree = load_sbt_index(db_out)
+
+    matches = tree.counter_gather(query)
+    assert len(matches) == 1
+    assert matches[0][0] == 1.0
+    assert matches[0][1].minhash == query.minhash
+    assert matches[0][2] == db_out
+    assert matches[0] == tree.gather(query)[0]
+
+
+def test_sbt_protein_search_top_n():
+    sigfile1 = utils.get_test_data('prot/protein/GCA_001593925.1_ASM159392v1_protein.faa.gz.sig')
+    db_out = utils.get_test_data('prot/protein.sbt.zip')
+
+    query = sourmash.load_one_signature(sigfile1)
+    tree = load_sbt_index(db_out)
+
+    results = tree.search(query, threshold=0.0)
+    assert len(results) == 2
+    best = max(results, key=lambda x: x[0])
+
+    results = tree.search(query, threshold=0.0, top_n=1)
+    assert results == [best]
+
+
 @utils.in_tempdir
 def test_sbt_hp_command_index(c):
     # test command-line creation of SBT database with hp sigs